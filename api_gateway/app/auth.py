@@ -0,0 +1,122 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+AUTH_SECRET_KEY: str = os.getenv("AUTH_SECRET_KEY", "")
+AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# Comma-separated ids of users allowed to call the /admin routes.
+AUTH_ADMIN_USER_IDS: frozenset[int] = frozenset(
+    int(part)
+    for part in os.getenv("AUTH_ADMIN_USER_IDS", "").split(",")
+    if part.strip()
+)
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+def _b64decode(raw: str) -> bytes:
+    return base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4))
+
+
+def decode_token(token: str) -> dict[str, Any]:
+    """Checks the HMAC-SHA256 signature of a token issued by user_services."""
+    if not AUTH_SECRET_KEY:
+        raise RuntimeError("AUTH_SECRET_KEY is not set")
+    try:
+        payload, signature = token.split(".")
+        expected = hmac.new(
+            AUTH_SECRET_KEY.encode(), payload.encode(), hashlib.sha256
+        ).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            raise InvalidTokenError("Invalid signature")
+        claims = json.loads(_b64decode(payload))
+        return {"sub": int(claims["sub"]), "jti": claims["jti"], "exp": claims["exp"]}
+    except (ValueError, KeyError, TypeError, binascii.Error) as e:
+        raise InvalidTokenError("Malformed token") from e
+
+
+class TokenVerifier:
+    """Stateless token verification with an LRU of verified tokens.
+
+    Signatures are checked once per token; cached claims are still checked
+    for expiry and against the revocation list on every request.
+    """
+
+    def __init__(self, cache_size: int = AUTH_CACHE_SIZE) -> None:
+        self._cache_size = cache_size
+        self._verified: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._revoked: dict[str, int] = {}
+
+    def verify(self, token: str) -> dict[str, Any]:
+        claims = self._verified.get(token)
+        if claims is None:
+            claims = decode_token(token)
+            self._verified[token] = claims
+            if len(self._verified) > self._cache_size:
+                self._verified.popitem(last=False)
+        else:
+            self._verified.move_to_end(token)
+
+        if claims["exp"] <= time.time():
+            self._verified.pop(token, None)
+            raise InvalidTokenError("Token expired")
+        if claims["jti"] in self._revoked:
+            raise InvalidTokenError("Token revoked")
+        return claims
+
+    def revoke(self, jti: str, expires_at: int) -> None:
+        now = time.time()
+        # Expired tokens are rejected anyway, so their ids can be forgotten.
+        self._revoked = {
+            revoked_jti: exp for revoked_jti, exp in self._revoked.items() if exp > now
+        }
+        if expires_at > now:
+            self._revoked[jti] = expires_at
+
+    def load_revoked(self, revoked: Iterable[tuple[str, int]]) -> None:
+        """Adds revocations persisted by user_services, e.g. at startup."""
+        now = time.time()
+        self._revoked.update((jti, exp) for jti, exp in revoked if exp > now)
+
+
+token_verifier = TokenVerifier()
+
+
+def on_auth_event(event: dict[str, Any]) -> None:
+    if event.get("type") == "token_revoked":
+        token_verifier.revoke(event["jti"], event["exp"])
+
+
+bearer_scheme = HTTPBearer()
+
+
+async def get_token_claims(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> dict[str, Any]:
+    try:
+        return token_verifier.verify(credentials.credentials)
+    except InvalidTokenError as e:
+        raise HTTPException(
+            status_code=401,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def require_admin(
+    claims: dict[str, Any] = Depends(get_token_claims),
+) -> dict[str, Any]:
+    if claims["sub"] not in AUTH_ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return claims
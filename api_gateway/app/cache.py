@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Hashable
+
+INVENTORY_CACHE_TTL: float = float(os.getenv("INVENTORY_CACHE_TTL", "5"))
+INVENTORY_CACHE_MAX_ENTRIES: int = int(
+    os.getenv("INVENTORY_CACHE_MAX_ENTRIES", "10000")
+)
+
+
+@dataclass
+class Snapshot:
+    data: Any
+    etag: str
+    last_modified: datetime
+    fetched_at: float
+
+
+def compute_etag(data: Any) -> str:
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return '"' + hashlib.sha1(payload.encode(), usedforsecurity=False).hexdigest() + '"'
+
+
+class SnapshotCache:
+    """Keeps JSON-ready snapshots with an ETag and a Last-Modified timestamp.
+
+    Entries are refreshed after ``ttl`` seconds or when invalidated by a change
+    event. Invalidated entries are only marked stale, so ``last_modified`` is
+    kept when the reloaded content turns out to be unchanged.
+    """
+
+    def __init__(
+        self,
+        ttl: float = INVENTORY_CACHE_TTL,
+        max_entries: int = INVENTORY_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: dict[Hashable, Snapshot] = {}
+
+    async def get(
+        self, key: Hashable, load: Callable[[], Awaitable[Any]]
+    ) -> Snapshot | None:
+        snapshot = self._entries.get(key)
+        now = time.monotonic()
+        if snapshot is not None and now - snapshot.fetched_at < self._ttl:
+            return snapshot
+
+        data = await load()
+        if data is None:
+            self._entries.pop(key, None)
+            return None
+
+        etag = compute_etag(data)
+        if snapshot is not None and snapshot.etag == etag:
+            snapshot.fetched_at = now
+            return snapshot
+
+        snapshot = Snapshot(
+            data=data,
+            etag=etag,
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            fetched_at=now,
+        )
+        if key not in self._entries and len(self._entries) >= self._max_entries:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = snapshot
+        return snapshot
+
+    def invalidate(self, key: Hashable) -> None:
+        snapshot = self._entries.get(key)
+        if snapshot is not None:
+            snapshot.fetched_at = float("-inf")
+
+    def invalidate_all(self) -> None:
+        for snapshot in self._entries.values():
+            snapshot.fetched_at = float("-inf")
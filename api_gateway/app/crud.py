@@ -1,8 +1,10 @@
+from datetime import datetime
 from typing import Sequence
 
 from database import async_session
+from sqlalchemy import tuple_
 from sqlalchemy.future import select
-from tables import User
+from tables import Inventory, Order, RevokedToken, User
 
 
 async def get_all_users() -> Sequence[User]:
@@ -12,8 +14,57 @@ async def get_all_users() -> Sequence[User]:
         return users
 
 
-async def get_user_by_id(user_id: int) -> User | None:
+async def get_users_by_ids(user_ids: Sequence[int]) -> Sequence[User]:
     async with async_session() as session:
-        result = await session.execute(select(User).where(User.id == user_id))
-        user = result.scalars().first()
-        return user
+        result = await session.execute(select(User).where(User.id.in_(user_ids)))
+        users = result.scalars().all()
+        return users
+
+
+async def get_inventory_item(item_id: int) -> Inventory | None:
+    async with async_session() as session:
+        result = await session.execute(select(Inventory).where(Inventory.id == item_id))
+        item = result.scalars().first()
+        return item
+
+
+async def get_inventory_page(after_id: int, limit: int) -> Sequence[Inventory]:
+    async with async_session() as session:
+        result = await session.execute(
+            select(Inventory)
+            .where(Inventory.id > after_id)
+            .order_by(Inventory.id)
+            .limit(limit)
+        )
+        items = result.scalars().all()
+        return items
+
+
+async def get_user_orders(
+    user_id: int,
+    limit: int,
+    status: str | None = None,
+    before: tuple[datetime, int] | None = None,
+) -> Sequence[Order]:
+    """Newest-first page of a user's orders, keyset-paginated on (created_at, id)."""
+    query = select(Order).where(Order.user_id == user_id)
+    if status is not None:
+        query = query.where(Order.status == status)
+    if before is not None:
+        query = query.where(tuple_(Order.created_at, Order.id) < before)
+    query = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit)
+    async with async_session() as session:
+        result = await session.execute(query)
+        orders = result.scalars().all()
+        return orders
+
+
+async def get_revoked_tokens(now: int) -> Sequence[tuple[str, int]]:
+    async with async_session() as session:
+        result = await session.execute(
+            select(RevokedToken.jti, RevokedToken.expires_at).where(
+                RevokedToken.expires_at > now
+            )
+        )
+        revoked = result.tuples().all()
+        return revoked
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Sequence
+
+from crud import get_users_by_ids
+from tables import User
+
+_logger = logging.getLogger(__name__)
+
+USER_LOADER_BATCH_WINDOW: float = float(os.getenv("USER_LOADER_BATCH_WINDOW", "0.005"))
+USER_LOADER_MAX_BATCH_SIZE: int = int(os.getenv("USER_LOADER_MAX_BATCH_SIZE", "100"))
+
+
+class UserLoader:
+    """Coalesces concurrent single-user lookups into batched ``IN`` queries.
+
+    Lookups arriving within ``batch_window`` seconds are resolved by one call
+    to ``batch_fn``. Identical ids share a single future, both while waiting
+    for the window to close and while the batch query is in flight.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Sequence[int]], Awaitable[Sequence[User]]],
+        batch_window: float = USER_LOADER_BATCH_WINDOW,
+        max_batch_size: int = USER_LOADER_MAX_BATCH_SIZE,
+    ) -> None:
+        self._batch_fn = batch_fn
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size
+        self._pending: dict[int, asyncio.Future[User | None]] = {}
+        self._in_flight: dict[int, asyncio.Future[User | None]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    async def load(self, user_id: int) -> User | None:
+        future = self._in_flight.get(user_id) or self._pending.get(user_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[user_id] = future
+            if len(self._pending) >= self._max_batch_size:
+                self._dispatch()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self._batch_window, self._dispatch)
+        # Shield so a cancelled request does not cancel the lookup other
+        # callers are waiting on.
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._in_flight.update(batch)
+        asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: dict[int, asyncio.Future[User | None]]) -> None:
+        try:
+            users = await self._batch_fn(list(batch))
+        except Exception as e:
+            _logger.error(f"Batched user lookup failed for ids {list(batch)}: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            by_id = {user.id: user for user in users}
+            for user_id, future in batch.items():
+                if not future.done():
+                    future.set_result(by_id.get(user_id))
+        finally:
+            for user_id in batch:
+                self._in_flight.pop(user_id, None)
+
+
+user_loader = UserLoader(get_users_by_ids)
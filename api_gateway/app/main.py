@@ -1,22 +1,104 @@
-from crud import get_all_users, get_user_by_id
-from fastapi import APIRouter, FastAPI, HTTPException
+import asyncio
+import base64
+import binascii
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, AsyncIterator
+
+from auth import get_token_claims, on_auth_event, require_admin, token_verifier
+from cache import Snapshot, SnapshotCache
+from crud import (
+    get_all_users,
+    get_inventory_item,
+    get_inventory_page,
+    get_revoked_tokens,
+    get_user_orders,
+    get_users_by_ids,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import JSONResponse
+from loader import USER_LOADER_MAX_BATCH_SIZE, user_loader
 from models import (
     InventoryAddRequest,
     InventoryAddResponse,
+    InventoryItemResponse,
+    InventoryPageResponse,
     OrderCreateResponse,
+    OrderHistoryResponse,
     OrderRequest,
+    OrderResponse,
+    ProfileResponse,
+    UserLoginRequest,
+    UserLoginResponse,
     UserRegisterRequest,
     UserRegisterResponse,
     UserResponse,
 )
-from producer import publish_and_wait_for_response
+from producer import (
+    EventBufferFullError,
+    event_publisher,
+    publish_and_wait_for_response,
+    publish_event,
+)
+from profiling import (
+    PROFILE_OUTPUT_DIR,
+    ProfilingMiddleware,
+    enable_profiling_triggers,
+    start_profiling,
+)
+from subscriber import start_event_listener
+
+_logger = logging.getLogger(__name__)
+
+PROFILING_ADMIN_ENABLED: bool = os.getenv("PROFILING_ADMIN_ENABLED", "False") == "True"
+
+inventory_item_cache = SnapshotCache()
+inventory_page_cache = SnapshotCache()
+
+
+def on_inventory_event(event: dict[str, Any]) -> None:
+    inventory_item_cache.invalidate(event.get("id"))
+    inventory_page_cache.invalidate_all()
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    loop = asyncio.get_running_loop()
+    enable_profiling_triggers(loop)
+    start_event_listener("inventory_events", on_inventory_event, loop)
+    start_event_listener("auth_events", on_auth_event, loop)
+    # Listeners start first to narrow the window in which a revocation is missed.
+    try:
+        token_verifier.load_revoked(await get_revoked_tokens(int(time.time())))
+    except Exception as e:
+        _logger.error(f"Failed to load revoked tokens: {e}")
+    event_publisher.start()
+    yield
+    await asyncio.to_thread(event_publisher.close)
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
 
 
 main_router = APIRouter(prefix="/main", tags=["Orders"])
 inventory_router = APIRouter(prefix="/inventory", tags=["Inventory"])
 user_router = APIRouter(prefix="/users", tags=["Users"])
+admin_router = APIRouter(
+    prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)]
+)
 
 
 @main_router.post("/orders", response_model=OrderCreateResponse)
@@ -25,32 +107,186 @@ def create_order(order: OrderRequest) -> OrderCreateResponse:
     return OrderCreateResponse(**response)
 
 
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+@main_router.get("/orders", response_model=OrderHistoryResponse)
+async def get_order_history(
+    user_id: int,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+) -> OrderHistoryResponse:
+    before = decode_cursor(cursor) if cursor is not None else None
+    orders = await get_user_orders(user_id, limit, status=status, before=before)
+    next_cursor = None
+    if len(orders) == limit:
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return OrderHistoryResponse(
+        items=[OrderResponse.model_validate(order) for order in orders],
+        next_cursor=next_cursor,
+    )
+
+
 @inventory_router.post("/new", response_model=InventoryAddResponse)
 def add_new_inventory_item(item: InventoryAddRequest) -> InventoryAddResponse:
     response = publish_and_wait_for_response("inventory_new_item", item.model_dump())
     return InventoryAddResponse(**response)
 
 
+def is_not_modified(request: Request, snapshot: Snapshot) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in etags or snapshot.etag in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return snapshot.last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": format_datetime(snapshot.last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if is_not_modified(request, snapshot):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=snapshot.data, headers=headers)
+
+
+@inventory_router.get("/", response_model=InventoryPageResponse)
+async def list_inventory(
+    request: Request,
+    after_id: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=500),
+) -> Response:
+    async def load() -> dict[str, Any]:
+        items = await get_inventory_page(after_id, limit)
+        page = InventoryPageResponse(
+            items=[InventoryItemResponse.model_validate(item) for item in items],
+            next_after_id=items[-1].id if len(items) == limit else None,
+        )
+        return page.model_dump(mode="json")
+
+    snapshot = await inventory_page_cache.get((after_id, limit), load)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return snapshot_response(request, snapshot)
+
+
+@inventory_router.get("/{item_id}", response_model=InventoryItemResponse)
+async def get_inventory(request: Request, item_id: int) -> Response:
+    async def load() -> dict[str, Any] | None:
+        item = await get_inventory_item(item_id)
+        if item is None:
+            return None
+        return InventoryItemResponse.model_validate(item).model_dump(mode="json")
+
+    snapshot = await inventory_item_cache.get(item_id, load)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return snapshot_response(request, snapshot)
+
+
 @user_router.post("/register", response_model=UserRegisterResponse)
 def register_user(user: UserRegisterRequest) -> UserRegisterResponse:
     result = publish_and_wait_for_response("user_register", user.model_dump())
     return UserRegisterResponse(**result)
 
 
+@user_router.post("/login", response_model=UserLoginResponse)
+def login_user(credentials: UserLoginRequest) -> UserLoginResponse:
+    result = publish_and_wait_for_response("user_login", credentials.model_dump())
+    if not result.get("success"):
+        raise HTTPException(status_code=401, detail=result.get("error"))
+    return UserLoginResponse(
+        access_token=result["access_token"], expires_at=result["expires_at"]
+    )
+
+
+@user_router.post("/logout", status_code=204)
+async def logout_user(claims: dict[str, Any] = Depends(get_token_claims)) -> None:
+    token_verifier.revoke(claims["jti"], claims["exp"])
+    # Let every other gateway instance revoke the token as well.
+    try:
+        publish_event(
+            "auth_events",
+            {"type": "token_revoked", "jti": claims["jti"], "exp": claims["exp"]},
+        )
+    except EventBufferFullError:
+        raise HTTPException(status_code=503, detail="Try again later")
+
+
+@user_router.get("/me", response_model=UserResponse)
+async def get_current_user(
+    claims: dict[str, Any] = Depends(get_token_claims),
+) -> UserResponse:
+    user_raw = await user_loader.load(claims["sub"])
+    if user_raw is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_raw
+
+
+def parse_ids(ids: str) -> list[int]:
+    try:
+        user_ids = list(
+            dict.fromkeys(int(part) for part in ids.split(",") if part.strip())
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="ids must be a comma-separated list of integers"
+        )
+    if len(user_ids) > USER_LOADER_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {USER_LOADER_MAX_BATCH_SIZE} ids can be requested",
+        )
+    return user_ids
+
+
 @user_router.get("/", response_model=list[UserResponse])
-async def get_users() -> list[UserResponse]:
-    users_raw = await get_all_users()
+async def get_users(ids: str | None = None) -> list[UserResponse]:
+    if ids is None:
+        users_raw = await get_all_users()
+    else:
+        user_ids = parse_ids(ids)
+        users_raw = await get_users_by_ids(user_ids) if user_ids else []
     return users_raw
 
 
 @user_router.get("/{user_id}", response_model=UserResponse)
 async def get_user(user_id: int) -> UserResponse:
-    user_raw = await get_user_by_id(user_id)
+    user_raw = await user_loader.load(user_id)
     if user_raw is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user_raw
 
 
+@admin_router.post("/profile", response_model=ProfileResponse)
+def profile(seconds: float = Query(default=30, gt=0, le=600)) -> ProfileResponse:
+    started = start_profiling(seconds)
+    return ProfileResponse(
+        started=started, seconds=seconds, output_dir=str(PROFILE_OUTPUT_DIR)
+    )
+
+
 app.include_router(main_router)
 app.include_router(inventory_router)
 app.include_router(user_router)
+if PROFILING_ADMIN_ENABLED:
+    app.include_router(admin_router)
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class OrderRequest(BaseModel):
@@ -27,6 +27,17 @@ class UserRegisterResponse(BaseModel):
     error: str | None = None
 
 
+class UserLoginRequest(BaseModel):
+    email: str
+    password: str
+
+
+class UserLoginResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_at: int
+
+
 class UserResponse(BaseModel):
     id: int
     username: str
@@ -44,8 +55,44 @@ class OrderCreateResponse(BaseModel):
     order_data: dict | None = None
 
 
+class OrderResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    product_id: int
+    quantity: int
+    status: str
+    created_at: datetime
+
+
+class OrderHistoryResponse(BaseModel):
+    items: list[OrderResponse]
+    next_cursor: str | None = None
+
+
+class ProfileResponse(BaseModel):
+    started: bool
+    seconds: float
+    output_dir: str
+
+
 class InventoryAddResponse(BaseModel):
     id: int
     quantity: int
     description: str | None = None
     created_at: str
+
+
+class InventoryItemResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    quantity: int
+    description: str | None = None
+    created_at: datetime | None = None
+
+
+class InventoryPageResponse(BaseModel):
+    items: list[InventoryItemResponse]
+    next_after_id: int | None = None
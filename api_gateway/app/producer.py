@@ -1,24 +1,189 @@
 import json
+import logging
 import os
+import queue
+import time
 import uuid
+from threading import Event, Thread
 
 import pika
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import ChannelClosedByBroker
+from pika.exchange_type import ExchangeType
+
+_logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+RABBITMQ_RETRY_DELAY = float(os.getenv("RABBITMQ_RETRY_DELAY", "5"))
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "10000"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "100"))
+EVENT_ENQUEUE_TIMEOUT = float(os.getenv("EVENT_ENQUEUE_TIMEOUT", "0"))
+EVENT_FLUSH_TIMEOUT = float(os.getenv("EVENT_FLUSH_TIMEOUT", "10"))
+# Dead-letter exchange the consuming services declare their queues with.
+DEAD_LETTER_EXCHANGE = "dlx"
+
+
+class EventBufferFullError(Exception):
+    pass
+
+
+class EventPublisher:
+    """Long-lived publisher for fire-and-forget events.
+
+    ``publish`` only appends to a bounded in-memory buffer. A background thread
+    drains it in batches of up to ``batch_size`` over a single connection: the
+    batch is published inside an AMQP transaction, and one ``tx.commit`` round
+    trip makes the broker take all of it. Each queue or exchange is declared
+    once per process. A batch stays buffered until its commit succeeds and is
+    published again after a reconnect otherwise.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = EVENT_BUFFER_SIZE,
+        batch_size: int = EVENT_BATCH_SIZE,
+    ) -> None:
+        self._buffer: queue.Queue[tuple[str, str, bytes]] = queue.Queue(
+            maxsize=buffer_size
+        )
+        self._batch_size = batch_size
+        self._uncommitted: list[tuple[str, str, bytes]] = []
+        self._declared: set[tuple[str, str]] = set()
+        self._thread: Thread | None = None
+        self._stop = Event()
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(
+        self,
+        kind: str,
+        name: str,
+        message: dict,
+        timeout: float = EVENT_ENQUEUE_TIMEOUT,
+    ) -> None:
+        """Queue ``message`` for a durable queue (``kind="queue"``) or a fanout
+        exchange (``kind="fanout"``), waiting up to ``timeout`` seconds for
+        buffer space."""
+        try:
+            item = (kind, name, json.dumps(message).encode())
+            self._buffer.put(item, timeout=timeout)
+        except queue.Full:
+            raise EventBufferFullError("Event buffer is full")
+
+    def close(self, timeout: float = EVENT_FLUSH_TIMEOUT) -> None:
+        """Flush everything buffered for up to ``timeout`` seconds, then stop
+        the background thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            dropped = self._buffer.qsize() + len(self._uncommitted)
+            _logger.error(f"Timed out flushing buffered events, dropping {dropped}")
+
+    def _drained(self) -> bool:
+        return self._stop.is_set() and not self._uncommitted and self._buffer.empty()
+
+    def _run(self) -> None:
+        while not self._drained():
+            connection = None
+            try:
+                connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=RABBITMQ_HOST)
+                )
+                channel = connection.channel()
+                channel.tx_select()
+                self._declared.clear()
+                while not self._drained():
+                    if not self._uncommitted:
+                        self._next_batch(connection)
+                    if self._uncommitted:
+                        self._publish_batch(channel)
+                connection.close()
+            except Exception:
+                _logger.exception("Event publisher failed, reconnecting")
+                self._close_quietly(connection)
+                time.sleep(RABBITMQ_RETRY_DELAY)
+
+    def _next_batch(self, connection: pika.BlockingConnection) -> None:
+        try:
+            self._uncommitted.append(self._buffer.get(timeout=1))
+        except queue.Empty:
+            # Keep heartbeats flowing while idle.
+            connection.process_data_events(0)
+            return
+        while len(self._uncommitted) < self._batch_size:
+            try:
+                self._uncommitted.append(self._buffer.get_nowait())
+            except queue.Empty:
+                return
+
+    def _publish_batch(self, channel: BlockingChannel) -> None:
+        for kind, name in dict.fromkeys(
+            (kind, name) for kind, name, _ in self._uncommitted
+        ):
+            try:
+                self._declare(channel, kind, name)
+            except ChannelClosedByBroker as e:
+                # Republishing would be refused the same way and block every
+                # event behind these ones.
+                _logger.error(f"Dropping events for '{name}' rejected by broker: {e}")
+                self._uncommitted = [
+                    item for item in self._uncommitted if item[:2] != (kind, name)
+                ]
+                raise
+        for kind, name, body in self._uncommitted:
+            channel.basic_publish(
+                exchange=name if kind == "fanout" else "",
+                routing_key="" if kind == "fanout" else name,
+                body=body,
+                properties=pika.BasicProperties(delivery_mode=2),
+            )
+        # One round trip for the whole batch.
+        channel.tx_commit()
+        self._uncommitted = []
+
+    def _declare(self, channel: BlockingChannel, kind: str, name: str) -> None:
+        if (kind, name) in self._declared:
+            return
+        if kind == "fanout":
+            channel.exchange_declare(
+                exchange=name, exchange_type=ExchangeType.fanout, durable=True
+            )
+        else:
+            # Must match the arguments the consuming service declares the queue
+            # with (see retries.declare_queue), or the broker closes the channel.
+            channel.queue_declare(
+                queue=name,
+                durable=True,
+                arguments={
+                    "x-dead-letter-exchange": DEAD_LETTER_EXCHANGE,
+                    "x-dead-letter-routing-key": name,
+                },
+            )
+        self._declared.add((kind, name))
+
+    @staticmethod
+    def _close_quietly(connection: pika.BlockingConnection | None) -> None:
+        if connection is None or connection.is_closed:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+event_publisher = EventPublisher()
 
 
 def publish(queue: str, message: dict):
-    connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
-    channel = connection.channel()
+    event_publisher.publish("queue", queue, message)
 
-    channel.queue_declare(queue=queue, durable=True)
-    channel.basic_publish(
-        exchange="",
-        routing_key=queue,
-        body=json.dumps(message),
-        properties=pika.BasicProperties(delivery_mode=2),
-    )
-    connection.close()
+
+def publish_event(exchange: str, message: dict):
+    event_publisher.publish("fanout", exchange, message)
 
 
 def publish_and_wait_for_response(queue: str, message: dict) -> dict:
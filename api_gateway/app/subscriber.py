@@ -0,0 +1,68 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from threading import Thread
+from typing import Any, Callable
+
+import pika
+from pika.exchange_type import ExchangeType
+
+_logger = logging.getLogger(__name__)
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+RABBITMQ_RETRY_DELAY = float(os.getenv("RABBITMQ_RETRY_DELAY", "5"))
+
+
+def listen_for_events(
+    exchange: str,
+    on_event: Callable[[dict[str, Any]], None],
+    loop: asyncio.AbstractEventLoop,
+) -> None:
+    """Consume a fanout exchange and hand every event to ``on_event`` on ``loop``.
+
+    Each gateway process binds its own exclusive queue, so every instance sees
+    every event. The connection is re-established if the broker goes away.
+    """
+    while True:
+        try:
+            connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=RABBITMQ_HOST)
+            )
+            channel = connection.channel()
+            channel.exchange_declare(
+                exchange=exchange, exchange_type=ExchangeType.fanout, durable=True
+            )
+            result = channel.queue_declare(queue="", exclusive=True)
+            queue = result.method.queue
+            if queue is None:
+                raise RuntimeError("Broker did not name the event queue")
+            channel.queue_bind(queue=queue, exchange=exchange)
+
+            def on_message(ch, method, props, body) -> None:
+                try:
+                    event = json.loads(body)
+                except ValueError as e:
+                    _logger.error(f"Dropping malformed event from '{exchange}': {e}")
+                    return
+                loop.call_soon_threadsafe(on_event, event)
+
+            channel.basic_consume(
+                queue=queue, on_message_callback=on_message, auto_ack=True
+            )
+            _logger.info(f"Listening for events on '{exchange}'")
+            channel.start_consuming()
+        except Exception as e:
+            _logger.error(f"Event listener for '{exchange}' failed: {e}")
+            time.sleep(RABBITMQ_RETRY_DELAY)
+
+
+def start_event_listener(
+    exchange: str,
+    on_event: Callable[[dict[str, Any]], None],
+    loop: asyncio.AbstractEventLoop,
+) -> None:
+    Thread(
+        target=listen_for_events, args=(exchange, on_event, loop), daemon=True
+    ).start()
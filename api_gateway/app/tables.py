@@ -11,3 +11,30 @@ class User(Base):  # type: ignore
     username = Column(String)
     email = Column(String)
     created_at = Column(DateTime)
+
+
+class Inventory(Base):  # type: ignore
+    __tablename__ = "inventory"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quantity = Column(Integer)
+    description = Column(String, nullable=True)
+    created_at = Column(DateTime)
+
+
+class Order(Base):  # type: ignore
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer)
+    product_id = Column(Integer)
+    quantity = Column(Integer)
+    status = Column(String)
+    created_at = Column(DateTime)
+
+
+class RevokedToken(Base):  # type: ignore
+    __tablename__ = "revoked_token"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(Integer)
@@ -7,13 +7,17 @@ from typing import Any
 
 import pika
 from database import async_session, create_db_and_tables
-from models import Inventory
+from models import Inventory, InventoryReservation
+from pika.exchange_type import ExchangeType
+from profiling import enable_profiling_triggers, timed
+from retries import declare_queue, retry_or_park
 from setup_logger import setup_logging
 from sqlmodel import select
 
 _logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "rabbitmq")
+INVENTORY_EVENTS_EXCHANGE: str = "inventory_events"
 
 
 async def check_and_update_inventory(data: dict[str, Any]) -> dict[str, Any]:
@@ -28,6 +32,13 @@ async def check_and_update_inventory(data: dict[str, Any]) -> dict[str, Any]:
         if not inv:
             _logger.warning(f"Product not found: {product_id}")
             return {"success": False, "message": "Product not found"}
+        # Checked under the row lock, so a concurrent duplicate waits for us.
+        reservation_id = data.get("reservation_id")
+        if reservation_id is not None and await session.get(
+            InventoryReservation, reservation_id
+        ):
+            _logger.info(f"Reservation {reservation_id} already applied")
+            return {"success": True, "message": "Inventory updated"}
         if inv.quantity < quantity:
             _logger.warning(
                 f"Not enough inventory for product {product_id}. Needed: {quantity}, Available: {inv.quantity}"
@@ -35,6 +46,12 @@ async def check_and_update_inventory(data: dict[str, Any]) -> dict[str, Any]:
             return {"success": False, "message": "Not enough inventory"}
         inv.quantity -= quantity
         session.add(inv)
+        if reservation_id is not None:
+            session.add(
+                InventoryReservation(
+                    id=reservation_id, product_id=product_id, quantity=quantity
+                )
+            )
         await session.commit()
         _logger.info(
             f"Inventory updated for product {product_id}. Remaining: {inv.quantity}"
@@ -42,6 +59,30 @@ async def check_and_update_inventory(data: dict[str, Any]) -> dict[str, Any]:
         return {"success": True, "message": "Inventory updated"}
 
 
+async def release_reservation(data: dict[str, Any]) -> bool:
+    """Return reserved stock; a no-op when the reservation is already gone."""
+    async with async_session() as session:
+        # Lock the inventory row first, in the same order as reservations do.
+        result = await session.execute(
+            select(Inventory)
+            .where(Inventory.id == data["product_id"])
+            .with_for_update()
+        )
+        inv = result.scalar_one_or_none()
+        reservation = await session.get(InventoryReservation, data["reservation_id"])
+        if inv is None or reservation is None:
+            _logger.info(f"Nothing to release for: {data}")
+            return False
+        inv.quantity += reservation.quantity
+        session.add(inv)
+        await session.delete(reservation)
+        await session.commit()
+        _logger.info(
+            f"Released reservation {reservation.id}. Remaining: {inv.quantity}"
+        )
+        return True
+
+
 async def add_new_item(data: dict[str, Any]) -> Inventory:
     _logger.info(f"Adding new item to inventory: {data}")
     async with async_session() as session:
@@ -55,6 +96,16 @@ async def add_new_item(data: dict[str, Any]) -> Inventory:
         return inv
 
 
+def publish_inventory_changed(ch, item_id: int) -> None:
+    """Notify readers (e.g. the gateway stock cache) that an item changed."""
+    ch.basic_publish(
+        exchange=INVENTORY_EVENTS_EXCHANGE,
+        routing_key="",
+        body=json.dumps({"id": item_id}),
+    )
+
+
+@timed("process_order_validate")
 def process_order_validate(ch, method, props, body, loop) -> None:
     try:
         data: dict[str, Any] = json.loads(body)
@@ -75,13 +126,26 @@ def process_order_validate(ch, method, props, body, loop) -> None:
             properties=pika.BasicProperties(correlation_id=props.correlation_id),
             body=json.dumps(response),
         )
+        if result["success"]:
+            publish_inventory_changed(ch, data["product_id"])
         ch.basic_ack(delivery_tag=method.delivery_tag)
         _logger.info(f"Processed order_validate: {response}")
     except Exception as e:
         _logger.error(f"Failed to process order_validate: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        parked = retry_or_park(ch, "order_validate", method, props, body, e)
+        if parked and props.reply_to:
+            # Unblock the waiting order service once no more retries will happen.
+            ch.basic_publish(
+                exchange="",
+                routing_key=props.reply_to,
+                properties=pika.BasicProperties(correlation_id=props.correlation_id),
+                body=json.dumps(
+                    {"success": False, "message": "Inventory validation failed"}
+                ),
+            )
 
 
+@timed("process_inventory_new_item")
 def process_inventory_new_item(ch, method, props, body, loop) -> None:
     try:
         data = json.loads(body)
@@ -102,19 +166,40 @@ def process_inventory_new_item(ch, method, props, body, loop) -> None:
             properties=pika.BasicProperties(correlation_id=props.correlation_id),
             body=json.dumps(response),
         )
+        publish_inventory_changed(ch, inv.id)
         ch.basic_ack(delivery_tag=method.delivery_tag)
         _logger.info(f"New inventory item added: {data}")
     except Exception as e:
         _logger.error(f"Failed to add new inventory item: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        retry_or_park(ch, "inventory_new_item", method, props, body, e)
+
+
+@timed("process_inventory_release")
+def process_inventory_release(ch, method, props, body, loop) -> None:
+    try:
+        data = json.loads(body)
+        _logger.info(f"Received inventory_release message: {data}")
+        future = asyncio.run_coroutine_threadsafe(release_reservation(data), loop)
+        if future.result(timeout=30):
+            publish_inventory_changed(ch, data["product_id"])
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        _logger.error(f"Failed to release reservation: {e}")
+        retry_or_park(ch, "inventory_release", method, props, body, e)
 
 
 def consume_messages(loop: asyncio.AbstractEventLoop) -> None:
     connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     channel = connection.channel()
 
-    channel.queue_declare(queue="order_validate", durable=True)
-    channel.queue_declare(queue="inventory_new_item", durable=True)
+    declare_queue(channel, "order_validate")
+    declare_queue(channel, "inventory_new_item")
+    declare_queue(channel, "inventory_release")
+    channel.exchange_declare(
+        exchange=INVENTORY_EVENTS_EXCHANGE,
+        exchange_type=ExchangeType.fanout,
+        durable=True,
+    )
     channel.basic_qos(prefetch_count=1)
 
     def on_order_validate(ch, method, props, body):
@@ -123,11 +208,20 @@ def consume_messages(loop: asyncio.AbstractEventLoop) -> None:
     def on_inventory_new_item(ch, method, props, body):
         process_inventory_new_item(ch, method, props, body, loop)
 
+    def on_inventory_release(ch, method, props, body):
+        process_inventory_release(ch, method, props, body, loop)
+
     channel.basic_consume(queue="order_validate", on_message_callback=on_order_validate)
     channel.basic_consume(
         queue="inventory_new_item", on_message_callback=on_inventory_new_item
     )
-    _logger.info("Started consuming on 'order_validate' and 'inventory_new_item'")
+    channel.basic_consume(
+        queue="inventory_release", on_message_callback=on_inventory_release
+    )
+    _logger.info(
+        "Started consuming on 'order_validate', 'inventory_new_item' "
+        "and 'inventory_release'"
+    )
     channel.start_consuming()
 
 
@@ -138,6 +232,7 @@ async def main() -> None:
     _logger.info("Database initialized.")
 
     loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    enable_profiling_triggers(loop)
     Thread(target=consume_messages, args=(loop,), daemon=True).start()
 
     while True:
@@ -9,3 +9,13 @@ class Inventory(SQLModel, table=True):
     quantity: int
     description: str | None = Field(default=None, nullable=True)
     created_at: datetime = Field(default_factory=datetime.now)
+
+
+class InventoryReservation(SQLModel, table=True):
+    """Stock taken for one order, keyed by a stable id so retries are no-ops."""
+
+    __tablename__ = "inventory_reservation"
+    id: str = Field(primary_key=True)
+    product_id: int
+    quantity: int
+    created_at: datetime = Field(default_factory=datetime.now)
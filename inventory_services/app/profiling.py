@@ -0,0 +1,185 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+_logger = logging.getLogger(__name__)
+
+PROFILE_OUTPUT_DIR: Path = Path(os.getenv("PROFILE_OUTPUT_DIR", "profiles"))
+PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_DURATION: float = float(os.getenv("PROFILE_DURATION", "30"))
+# Seconds to profile right after startup; 0 disables.
+PROFILE_ON_START: float = float(os.getenv("PROFILE_ON_START", "0"))
+# tracemalloc slows every allocation down and would distort the timings and
+# stack samples, so allocation tracking is opt-in.
+PROFILE_TRACEMALLOC: bool = os.getenv("PROFILE_TRACEMALLOC", "False") == "True"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Checked by every timed handler; keeps the disabled path to one global read.
+_active: bool = False
+_session_lock = threading.Lock()
+
+
+@dataclass
+class HandlerStats:
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    max_wall: float = 0.0
+
+
+_handler_stats: dict[str, HandlerStats] = {}
+_stats_lock = threading.Lock()
+
+
+def record(name: str, wall: float, cpu: float = 0.0) -> None:
+    with _stats_lock:
+        stats = _handler_stats.setdefault(name, HandlerStats())
+        stats.calls += 1
+        stats.wall += wall
+        stats.cpu += cpu
+        stats.max_wall = max(stats.max_wall, wall)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Records wall and CPU time of a handler while a profiling session runs.
+
+    CPU time is per thread, so it is only recorded for synchronous handlers.
+    """
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not _active:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(name, time.perf_counter() - started)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _active:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            cpu_started = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(
+                    name,
+                    time.perf_counter() - started,
+                    time.thread_time() - cpu_started,
+                )
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def sample_stacks(stacks: Counter[str], ignore: int) -> None:
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == ignore:
+            continue
+        frames = []
+        current: Any = frame
+        while current is not None:
+            code = current.f_code
+            frames.append(
+                f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+            )
+            current = current.f_back
+        frames.append(names.get(thread_id, str(thread_id)))
+        stacks[";".join(reversed(frames))] += 1
+
+
+def run_session(seconds: float) -> None:
+    global _active
+    stacks: Counter[str] = Counter()
+    me = threading.get_ident()
+    with _stats_lock:
+        _handler_stats.clear()
+    baseline = None
+    if PROFILE_TRACEMALLOC:
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+    _active = True
+    try:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            sample_stacks(stacks, me)
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+    finally:
+        _active = False
+        allocations = None
+        if baseline is not None:
+            allocations = tracemalloc.take_snapshot().compare_to(baseline, "lineno")
+            tracemalloc.stop()
+        write_report(stacks, allocations)
+        _session_lock.release()
+
+
+def write_report(
+    stacks: Counter[str], allocations: list[tracemalloc.StatisticDiff] | None
+) -> None:
+    PROFILE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    prefix = PROFILE_OUTPUT_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    # Collapsed stacks, ready for flamegraph.pl or speedscope.
+    with open(f"{prefix}.collapsed", "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    with open(f"{prefix}.handlers.txt", "w") as f:
+        f.write("handler calls wall_total_s cpu_total_s wall_avg_ms wall_max_ms\n")
+        with _stats_lock:
+            items = sorted(_handler_stats.items(), key=lambda kv: -kv[1].wall)
+        for name, stats in items:
+            f.write(
+                f"{name} {stats.calls} {stats.wall:.3f} {stats.cpu:.3f} "
+                f"{stats.wall / stats.calls * 1000:.2f} {stats.max_wall * 1000:.2f}\n"
+            )
+
+    if allocations is not None:
+        with open(f"{prefix}.alloc.txt", "w") as f:
+            for stat in allocations[:50]:
+                f.write(f"{stat}\n")
+
+    _logger.info(f"Profile written to {prefix}.*")
+
+
+def start_profiling(seconds: float = PROFILE_DURATION) -> bool:
+    """Profiles the running process for ``seconds`` in a background thread.
+
+    Returns False if a session is already running.
+    """
+    if not _session_lock.acquire(blocking=False):
+        _logger.warning("Profiling session already running")
+        return False
+    _logger.info(f"Profiling for {seconds}s")
+    threading.Thread(target=run_session, args=(seconds,), daemon=True).start()
+    return True
+
+
+def enable_profiling_triggers(loop: asyncio.AbstractEventLoop) -> None:
+    """``kill -USR1 <pid>`` profiles for PROFILE_DURATION seconds."""
+    loop.add_signal_handler(signal.SIGUSR1, start_profiling)
+    if PROFILE_ON_START > 0:
+        start_profiling(PROFILE_ON_START)
@@ -0,0 +1,114 @@
+import logging
+import os
+from typing import Any
+
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exchange_type import ExchangeType
+from pika.spec import Basic
+
+_logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY_MS: int = int(os.getenv("RETRY_BASE_DELAY_MS", "1000"))
+RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+DEAD_LETTER_EXCHANGE: str = "dlx"
+ATTEMPTS_HEADER: str = "x-attempts"
+LAST_ERROR_HEADER: str = "x-last-error"
+# Errors caused by the message itself; retrying them cannot succeed.
+NON_RETRYABLE_ERRORS: tuple[type[Exception], ...] = (ValueError, KeyError, TypeError)
+
+
+def retry_delays() -> list[int]:
+    """Delay in milliseconds of each retry tier, doubling per attempt."""
+    return [RETRY_BASE_DELAY_MS * 2**i for i in range(RETRY_MAX_ATTEMPTS - 1)]
+
+
+def retry_queue_name(queue: str, delay_ms: int) -> str:
+    return f"{queue}.retry.{delay_ms}ms"
+
+
+def parking_queue_name(queue: str) -> str:
+    return f"{queue}.parking"
+
+
+def declare_queue(channel: BlockingChannel, queue: str) -> None:
+    """Declare ``queue`` together with its retry tiers and parking-lot queue.
+
+    Rejected messages are dead-lettered through ``DEAD_LETTER_EXCHANGE`` into
+    the parking lot. Each retry tier is a TTL'd queue without consumers that
+    dead-letters expired messages back into ``queue``, so waiting retries put
+    no load on the hot queue.
+    """
+    channel.exchange_declare(
+        exchange=DEAD_LETTER_EXCHANGE, exchange_type=ExchangeType.direct, durable=True
+    )
+    parking_queue = parking_queue_name(queue)
+    channel.queue_declare(queue=parking_queue, durable=True)
+    channel.queue_bind(
+        queue=parking_queue, exchange=DEAD_LETTER_EXCHANGE, routing_key=queue
+    )
+    for delay_ms in retry_delays():
+        channel.queue_declare(
+            queue=retry_queue_name(queue, delay_ms),
+            durable=True,
+            arguments={
+                "x-message-ttl": delay_ms,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue,
+            },
+        )
+    channel.queue_declare(
+        queue=queue,
+        durable=True,
+        arguments={
+            "x-dead-letter-exchange": DEAD_LETTER_EXCHANGE,
+            "x-dead-letter-routing-key": queue,
+        },
+    )
+
+
+def retry_or_park(
+    channel: BlockingChannel,
+    queue: str,
+    method: Basic.Deliver,
+    props: pika.BasicProperties,
+    body: bytes,
+    error: Exception,
+    extra_headers: dict[str, Any] | None = None,
+) -> bool:
+    """Move a failed message to its next retry tier or to the parking lot.
+
+    ``extra_headers`` lets a handler record progress (e.g. a completed
+    reservation) so the retry can skip steps that already succeeded. The
+    original delivery is acked once the copy is published. Returns True when
+    the message was parked, i.e. it will not be retried again.
+    """
+    headers = dict(props.headers or {})
+    headers.update(extra_headers or {})
+    attempts = int(headers.get(ATTEMPTS_HEADER, 0)) + 1
+    headers[ATTEMPTS_HEADER] = attempts
+    headers[LAST_ERROR_HEADER] = f"{type(error).__name__}: {error}"[:1000]
+
+    parked = isinstance(error, NON_RETRYABLE_ERRORS) or attempts >= RETRY_MAX_ATTEMPTS
+    if parked:
+        routing_key = parking_queue_name(queue)
+        _logger.error(f"Parking message from '{queue}' after {attempts} attempt(s)")
+    else:
+        routing_key = retry_queue_name(queue, retry_delays()[attempts - 1])
+        _logger.warning(f"Scheduling retry {attempts} of message from '{queue}'")
+
+    channel.basic_publish(
+        exchange="",
+        routing_key=routing_key,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            headers=headers,
+            reply_to=props.reply_to,
+            correlation_id=props.correlation_id,
+            message_id=props.message_id,
+            content_type=props.content_type,
+        ),
+        body=body,
+    )
+    channel.basic_ack(delivery_tag=method.delivery_tag)  # type: ignore[arg-type]
+    return parked
@@ -2,42 +2,68 @@ import asyncio
 import json
 import logging
 import os
+import signal
 import uuid
-from threading import Thread
+from threading import Event, Thread
 from typing import Any
 
 import pika
 from database import async_session, create_db_and_tables
 from models import Order
+from profiling import enable_profiling_triggers, timed
+from retries import declare_queue, retry_or_park
 from setup_logger import setup_logging
+from sqlalchemy import select
+from writer import order_writer
 
 _logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "rabbitmq")
+# Each worker has its own connection and handles one order at a time; running
+# several lets the order writer batch inserts from concurrent orders.
+ORDER_CONSUMER_WORKERS: int = int(os.getenv("ORDER_CONSUMER_WORKERS", "8"))
+# Longer than a handler can take (inventory validation plus a 30s save).
+ORDER_SHUTDOWN_TIMEOUT: float = float(os.getenv("ORDER_SHUTDOWN_TIMEOUT", "60"))
+# Carries the reservation id of an order whose stock is already reserved, so a
+# retry only repeats the save.
+RESERVED_HEADER: str = "x-inventory-reserved"
 
 
-async def save_order(data: dict[str, Any]) -> Order:
+class OrderNotSavedError(Exception):
+    """Inventory was reserved but persisting the order failed."""
+
+    def __init__(self, reservation_id: str, product_id: int, cause: Exception):
+        super().__init__(f"Order not saved: {cause}")
+        self.reservation_id = reservation_id
+        self.product_id = product_id
+
+
+async def save_order(data: dict[str, Any], reservation_id: str) -> Order:
     _logger.info(f"Processing save_order: {data}")
-    async with async_session() as session:
-        order = Order(**data)
-        session.add(order)
-        await session.commit()
-        await session.refresh(order)
-        _logger.info(f"Order saved: {order.id}")
-        return order
+    order = await order_writer.save(Order(**data, reservation_id=reservation_id))
+    _logger.info(f"Order saved: {order.id}")
+    return order
+
 
+@timed("validate_inventory")
+def validate_inventory(data: dict[str, Any], reservation_id: str) -> tuple[bool, str]:
+    """Send validation request to inventory_service and wait for response.
 
-def validate_inventory(data: dict[str, Any]) -> tuple[bool, str]:
-    """Send validation request to inventory_service and wait for response."""
+    ``reservation_id`` must be stable across retries of the same order; the
+    inventory service applies each reservation at most once.
+    """
     connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     channel = connection.channel()
 
-    callback_queue = "order_validate_response"
-    channel.queue_declare(queue=callback_queue, durable=True)
+    # Exclusive per-call queue, so concurrent workers never consume each
+    # other's responses.
+    result = channel.queue_declare(queue="", exclusive=True)
+    callback_queue = result.method.queue
     corr_id = str(uuid.uuid4())
 
     order_data = {
         "order_id": corr_id,
+        "reservation_id": reservation_id,
         "product_id": data["product_id"],
         "quantity": data["quantity"],
     }
@@ -69,95 +95,169 @@ def validate_inventory(data: dict[str, Any]) -> tuple[bool, str]:
     return response.get("success", False), response.get("message", "")
 
 
+def release_inventory(
+    channel: pika.adapters.blocking_connection.BlockingChannel,
+    reservation_id: str,
+    product_id: int,
+) -> None:
+    channel.basic_publish(
+        exchange="",
+        routing_key="inventory_release",
+        properties=pika.BasicProperties(delivery_mode=2),
+        body=json.dumps({"reservation_id": reservation_id, "product_id": product_id}),
+    )
+
+
+async def order_saved(reservation_id: str) -> bool:
+    async with async_session() as session:
+        result = await session.execute(
+            select(Order.id).where(Order.reservation_id == reservation_id)
+        )
+        return result.first() is not None
+
+
+def release_unsaved_order(
+    channel: pika.adapters.blocking_connection.BlockingChannel,
+    error: OrderNotSavedError,
+    loop: asyncio.AbstractEventLoop,
+) -> None:
+    """Give the stock of a parked order back, unless a save that timed out
+    committed the order after all."""
+    future = asyncio.run_coroutine_threadsafe(order_saved(error.reservation_id), loop)
+    try:
+        saved = future.result(timeout=30)
+    except Exception as e:
+        future.cancel()
+        _logger.error(
+            f"Could not check order {error.reservation_id}, "
+            f"keeping its stock reserved: {e}"
+        )
+        return
+    if saved:
+        _logger.warning(f"Parked order {error.reservation_id} was saved after all")
+        return
+    release_inventory(channel, error.reservation_id, error.product_id)
+
+
+def reservation_id_for(props: pika.BasicProperties) -> str:
+    headers = props.headers or {}
+    reservation_id = (
+        headers.get(RESERVED_HEADER) or props.message_id or props.correlation_id
+    )
+    if reservation_id is None:
+        reservation_id = str(uuid.uuid4())
+        _logger.warning("Order message has no id; retries will reserve again")
+    return reservation_id
+
+
+def reply(
+    channel: pika.adapters.blocking_connection.BlockingChannel,
+    props: pika.BasicProperties,
+    response: dict[str, Any],
+) -> None:
+    if props and props.reply_to:
+        channel.basic_publish(
+            exchange="",
+            routing_key=props.reply_to,
+            properties=pika.BasicProperties(correlation_id=props.correlation_id),
+            body=json.dumps(response),
+        )
+
+
+@timed("process_message")
 def process_message(
     body: bytes,
     props: pika.BasicProperties,
     channel: pika.adapters.blocking_connection.BlockingChannel,
     loop: asyncio.AbstractEventLoop,
 ) -> bool:
-    try:
-        data: dict[str, Any] = json.loads(body)
-        _logger.info(f"Processing order: {data}")
-
-        valid, message = validate_inventory(data)
-        _logger.info(f"Valid: {valid}, Message: {message}")
-        if not valid:
-            response = {
-                "order_id": None,
-                "success": False,
-                "message": f"Order failed: {message}",
-                "order_data": data,
-                "created_at": None,
-            }
-            if props.reply_to:
-                channel.basic_publish(
-                    exchange="",
-                    routing_key=props.reply_to,
-                    properties=pika.BasicProperties(
-                        correlation_id=props.correlation_id
-                    ),
-                    body=json.dumps(response),
-                )
-            _logger.warning(f"Inventory validation failed: {message}")
-            return False
-
-        future = asyncio.run_coroutine_threadsafe(save_order(data), loop)
-        order: Order = future.result(timeout=30)
-        response = {
-            "order_id": order.id,
-            "success": True,
-            "message": "Order created successfully",
-            "order_data": data,
-            "created_at": order.created_at.isoformat()
-            if hasattr(order, "created_at") and order.created_at
-            else None,
-        }
-        if props.reply_to:
-            channel.basic_publish(
-                exchange="",
-                routing_key=props.reply_to,
-                properties=pika.BasicProperties(correlation_id=props.correlation_id),
-                body=json.dumps(response),
-            )
-        return True
-    except Exception as e:
-        _logger.error(f"Failed to process message: {e}")
+    data: dict[str, Any] = json.loads(body)
+    _logger.info(f"Processing order: {data}")
+
+    reservation_id = reservation_id_for(props)
+    if props.headers and RESERVED_HEADER in props.headers:
+        valid, message = True, "Inventory already reserved"
+    else:
+        valid, message = validate_inventory(data, reservation_id)
+    _logger.info(f"Valid: {valid}, Message: {message}")
+    if not valid:
         response = {
             "order_id": None,
             "success": False,
-            "message": f"Order failed: {str(e)}",
-            "order_data": None,
+            "message": f"Order failed: {message}",
+            "order_data": data,
             "created_at": None,
         }
-        if props and hasattr(props, "reply_to") and props.reply_to:
-            channel.basic_publish(
-                exchange="",
-                routing_key=props.reply_to,
-                properties=pika.BasicProperties(correlation_id=props.correlation_id),
-                body=json.dumps(response),
-            )
+        reply(channel, props, response)
+        _logger.warning(f"Inventory validation failed: {message}")
         return False
 
+    future = asyncio.run_coroutine_threadsafe(save_order(data, reservation_id), loop)
+    try:
+        order: Order = future.result(timeout=30)
+    except Exception as e:
+        # A batch already being inserted may still commit; the retry then finds
+        # the order by its reservation id instead of inserting it again.
+        future.cancel()
+        raise OrderNotSavedError(reservation_id, data["product_id"], e) from e
+    response = {
+        "order_id": order.id,
+        "success": True,
+        "message": "Order created successfully",
+        "order_data": data,
+        "created_at": order.created_at.isoformat()
+        if hasattr(order, "created_at") and order.created_at
+        else None,
+    }
+    reply(channel, props, response)
+    return True
+
+
+def consume_messages(loop: asyncio.AbstractEventLoop, stopping: Event) -> None:
+    """Consume ``order_created`` until ``stopping`` is set.
 
-def consume_messages(loop: asyncio.AbstractEventLoop) -> None:
+    Handlers run inside ``process_data_events``, so the loop only exits
+    between messages, after the in-flight order was replied to and acked.
+    """
     connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     channel = connection.channel()
 
     queue_name = "order_created"
-    channel.queue_declare(queue=queue_name, durable=True)
+    declare_queue(channel, queue_name)
+    declare_queue(channel, "inventory_release")
     channel.basic_qos(prefetch_count=1)
 
     def on_message(ch, method, props, body) -> None:
-        success = process_message(body, props, ch, loop)
-        if method and method.delivery_tag is not None:
-            if success:
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            else:
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-
-    channel.basic_consume(queue=queue_name, on_message_callback=on_message)
+        try:
+            process_message(body, props, ch, loop)
+        except Exception as e:
+            _logger.error(f"Failed to process message: {e}")
+            extra_headers = None
+            if isinstance(e, OrderNotSavedError):
+                extra_headers = {RESERVED_HEADER: e.reservation_id}
+            if retry_or_park(ch, queue_name, method, props, body, e, extra_headers):
+                if isinstance(e, OrderNotSavedError):
+                    # The order is given up on; give its stock back.
+                    release_unsaved_order(ch, e, loop)
+                response = {
+                    "order_id": None,
+                    "success": False,
+                    "message": f"Order failed: {str(e)}",
+                    "order_data": None,
+                    "created_at": None,
+                }
+                reply(ch, props, response)
+        else:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    consumer_tag = channel.basic_consume(
+        queue=queue_name, on_message_callback=on_message
+    )
     _logger.info("Started consuming on 'order_created'")
-    channel.start_consuming()
+    while not stopping.is_set():
+        connection.process_data_events(time_limit=1)
+    channel.basic_cancel(consumer_tag)
+    connection.close()
 
 
 async def main() -> None:
@@ -166,10 +266,31 @@ async def main() -> None:
     await create_db_and_tables()
 
     loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
-    Thread(target=consume_messages, args=(loop,), daemon=True).start()
+    enable_profiling_triggers(loop)
+    stopping = Event()
+    workers = [
+        Thread(target=consume_messages, args=(loop, stopping), daemon=True)
+        for _ in range(ORDER_CONSUMER_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+    await stop.wait()
 
-    while True:
-        await asyncio.sleep(1)
+    # Stop taking new orders and let in-flight ones finish (their saves still
+    # need the writer and this loop), then flush whatever is left buffered.
+    _logger.info("Shutting down, waiting for in-flight orders...")
+    stopping.set()
+    deadline = loop.time() + ORDER_SHUTDOWN_TIMEOUT
+    for worker in workers:
+        await asyncio.to_thread(worker.join, max(0.0, deadline - loop.time()))
+        if worker.is_alive():
+            _logger.error("Consumer did not stop in time")
+    _logger.info("Flushing buffered orders...")
+    await order_writer.close()
 
 
 if __name__ == "__main__":
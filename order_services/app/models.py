@@ -1,13 +1,30 @@
 from datetime import datetime
 
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 
 class Order(SQLModel, table=True):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Serve per-user order history with keyset pagination, with and
+        # without a status filter. Existing databases get them from
+        # migrations/001_orders_history_indexes.sql.
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index(
+            "ix_orders_user_id_status_created_at_id",
+            "user_id",
+            "status",
+            "created_at",
+            "id",
+        ),
+    )
     id: int = Field(default=None, primary_key=True)
     user_id: int
     product_id: int
     quantity: int
     status: str = "pending"
     created_at: datetime = Field(default_factory=datetime.now)
+    # Stable across retries of the same order message, so a retried save finds
+    # the order inserted by an earlier attempt instead of inserting it again.
+    reservation_id: str | None = Field(default=None, unique=True, index=True)
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from database import async_session, engine
+from models import Order
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+_logger = logging.getLogger(__name__)
+
+# Each consumer worker waits on one order at a time, so a batch never holds more
+# than ORDER_CONSUMER_WORKERS orders; a larger batch size has no effect.
+ORDER_WRITER_MAX_BATCH_SIZE: int = int(
+    os.getenv("ORDER_WRITER_MAX_BATCH_SIZE", os.getenv("ORDER_CONSUMER_WORKERS", "8"))
+)
+ORDER_WRITER_MAX_DELAY: float = float(os.getenv("ORDER_WRITER_MAX_DELAY", "0.005"))
+
+
+class OrderWriter:
+    """Write-behind buffer persisting orders in multi-row INSERTs.
+
+    Orders are collected for at most ``max_delay`` seconds or until
+    ``max_batch_size`` are waiting, then inserted with a single
+    ``INSERT ... ON CONFLICT (reservation_id) DO NOTHING RETURNING`` and one
+    commit. An order whose reservation id is already stored resolves to the
+    existing row, so saving the same order twice inserts it once. Each caller
+    of ``save`` is resumed once its batch is committed.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = ORDER_WRITER_MAX_BATCH_SIZE,
+        max_delay: float = ORDER_WRITER_MAX_DELAY,
+    ) -> None:
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._buffer: list[tuple[Order, asyncio.Future[Order]]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+        self._closed = False
+
+    async def save(self, order: Order) -> Order:
+        if self._closed:
+            raise RuntimeError("Order writer is closed")
+        if order.reservation_id is None:
+            raise ValueError("Order has no reservation id")
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Order] = loop.create_future()
+        self._buffer.append((order, future))
+        if len(self._buffer) >= self._max_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_delay, self._start_flush)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Not picked up by a flush yet, so it can still be dropped.
+            self._buffer = [item for item in self._buffer if item[1] is not future]
+            raise
+
+    async def close(self) -> None:
+        """Stop accepting orders and wait until everything buffered is committed."""
+        self._closed = True
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[tuple[Order, asyncio.Future[Order]]]) -> None:
+        try:
+            saved = await self._insert([order for order, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Isolate the failing order instead of failing the whole batch.
+                # Safe even if the batch was committed: nothing is inserted twice.
+                _logger.warning(f"Batch insert of {len(batch)} orders failed: {e}")
+                for item in batch:
+                    await self._flush([item])
+                return
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        _logger.info(f"Saved batch of {len(batch)} orders")
+        for order, future in batch:
+            if future.done():
+                continue
+            if order.reservation_id not in saved:
+                future.set_exception(RuntimeError("Saved order not found"))
+                continue
+            order.id, order.created_at = saved[order.reservation_id]
+            future.set_result(order)
+
+    async def _insert(self, orders: list[Order]) -> dict[str, tuple[int, datetime]]:
+        """Insert ``orders`` and return (id, created_at) by reservation id, for
+        new and already stored orders alike."""
+        dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+        async with async_session() as session:
+            result = await session.execute(
+                dialect.insert(Order)
+                .values([order.model_dump(exclude={"id"}) for order in orders])
+                .on_conflict_do_nothing(index_elements=["reservation_id"])
+                .returning(Order.reservation_id, Order.id, Order.created_at)
+            )
+            saved = {row[0]: (row[1], row[2]) for row in result}
+            existing = {order.reservation_id for order in orders} - saved.keys()
+            if existing:
+                result = await session.execute(
+                    select(Order.reservation_id, Order.id, Order.created_at).where(
+                        Order.reservation_id.in_(existing)
+                    )
+                )
+                saved.update({row[0]: (row[1], row[2]) for row in result})
+            await session.commit()
+        return saved
+
+
+order_writer = OrderWriter()
@@ -0,0 +1,15 @@
+-- Indexes serving per-user order history (GET /main/orders on the gateway).
+--
+-- CREATE INDEX CONCURRENTLY does not block inserts into orders, but it cannot
+-- run inside a transaction block. Run this file with psql in autocommit mode:
+--
+--     psql "$DATABASE_URL" -f order_services/migrations/001_orders_history_indexes.sql
+--
+-- If a build fails it leaves an INVALID index behind, which IF NOT EXISTS would
+-- skip on the next run. Drop it first with DROP INDEX CONCURRENTLY <name>.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_user_id_created_at_id
+    ON orders (user_id, created_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_user_id_status_created_at_id
+    ON orders (user_id, status, created_at, id);
@@ -0,0 +1,12 @@
+-- Idempotent order saves: each order stores the reservation id of its
+-- message, and the unique index makes a retried insert a no-op.
+--
+-- Adding a nullable column without a default only updates the catalog. The
+-- index is built CONCURRENTLY, so run this file with psql in autocommit mode:
+--
+--     psql "$DATABASE_URL" -f order_services/migrations/002_orders_reservation_id.sql
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS reservation_id VARCHAR;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_reservation_id
+    ON orders (reservation_id);
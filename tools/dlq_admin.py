@@ -0,0 +1,111 @@
+"""Inspect and replay messages parked by the service consumers.
+
+Usage:
+    python tools/dlq_admin.py list order_created --limit 20
+    python tools/dlq_admin.py replay order_created --limit 100
+"""
+
+import argparse
+import json
+import os
+
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+
+RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "localhost")
+ATTEMPTS_HEADER: str = "x-attempts"
+LAST_ERROR_HEADER: str = "x-last-error"
+# Set by the order service when stock was reserved; parked orders release
+# their reservation, so a replay has to reserve again.
+RESERVED_HEADER: str = "x-inventory-reserved"
+# Never printed, in case a message carrying credentials was parked.
+REDACTED_FIELDS: frozenset[str] = frozenset({"password"})
+
+
+def parking_queue_name(queue: str) -> str:
+    return f"{queue}.parking"
+
+
+def redact(body: bytes | str) -> str:
+    text = body.decode(errors="replace") if isinstance(body, bytes) else body
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    if not isinstance(data, dict):
+        return text
+    return json.dumps(
+        {key: "***" if key in REDACTED_FIELDS else value for key, value in data.items()}
+    )
+
+
+def list_parked(channel: BlockingChannel, queue: str, limit: int) -> None:
+    """Print parked messages without removing them from the parking lot."""
+    parking_queue = parking_queue_name(queue)
+    count = 0
+    while count < limit:
+        method, props, body = channel.basic_get(queue=parking_queue, auto_ack=False)
+        if method is None or props is None or body is None:
+            break
+        count += 1
+        headers = props.headers or {}
+        print(
+            f"#{count} attempts={headers.get(ATTEMPTS_HEADER, 0)} "
+            f"error={headers.get(LAST_ERROR_HEADER, '-')}"
+        )
+        print(f"    {redact(body)}")
+    # Unacked messages go back to the parking lot once the channel closes.
+    print(f"{count} message(s) shown from '{parking_queue}'")
+
+
+def replay_parked(channel: BlockingChannel, queue: str, limit: int) -> None:
+    """Move parked messages back to their original queue with a fresh retry budget."""
+    parking_queue = parking_queue_name(queue)
+    channel.confirm_delivery()
+    count = 0
+    while count < limit:
+        method, props, body = channel.basic_get(queue=parking_queue, auto_ack=False)
+        if method is None or props is None or body is None:
+            break
+        headers = dict(props.headers or {})
+        headers.pop(ATTEMPTS_HEADER, None)
+        headers.pop(LAST_ERROR_HEADER, None)
+        headers.pop(RESERVED_HEADER, None)
+        channel.basic_publish(
+            exchange="",
+            routing_key=queue,
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                headers=headers,
+                reply_to=props.reply_to,
+                correlation_id=props.correlation_id,
+                message_id=props.message_id,
+                content_type=props.content_type,
+            ),
+            body=body,
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)  # type: ignore[arg-type]
+        count += 1
+    print(f"{count} message(s) replayed from '{parking_queue}' to '{queue}'")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("queue", help="original queue name, e.g. order_created")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+    try:
+        channel = connection.channel()
+        if args.command == "list":
+            list_parked(channel, args.queue, args.limit)
+        else:
+            replay_parked(channel, args.queue, args.limit)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
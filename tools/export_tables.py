@@ -0,0 +1,228 @@
+"""Stream the orders and inventory tables to CSV, Parquet or Arrow IPC files.
+
+Usage:
+    python tools/export_tables.py orders orders.parquet
+    python tools/export_tables.py inventory inventory.csv.gz --format csv
+    python tools/export_tables.py orders orders-delta.parquet --state-file export.json
+
+Rows are read in id order, one chunk per query (``id > last id ORDER BY id
+LIMIT chunk size``). Every chunk runs in its own short read-only transaction,
+so neither memory use nor transaction length depends on the table size.
+Point EXPORT_DATABASE_URL at a read replica to keep load off the primary.
+``--state-file`` remembers the last exported id per table, so the next run
+only exports newer rows.
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Protocol
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+EXPORT_DATABASE_URL: str = os.getenv(
+    "EXPORT_DATABASE_URL", os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
+)
+
+metadata = MetaData()
+
+# Exported tables; column types map to Arrow types.
+TABLES: dict[str, Table] = {
+    "orders": Table(
+        "orders",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer),
+        Column("product_id", Integer),
+        Column("quantity", Integer),
+        Column("status", String),
+        Column("created_at", DateTime),
+    ),
+    "inventory": Table(
+        "inventory",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("quantity", Integer),
+        Column("description", String),
+        Column("created_at", DateTime),
+    ),
+}
+
+
+class ChunkWriter(Protocol):
+    def write(self, rows: list[dict[str, Any]]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class CsvWriter:
+    def __init__(self, path: Path, columns: list[str]) -> None:
+        if path.suffix == ".gz":
+            self._file = gzip.open(path, "wt", newline="")
+        else:
+            self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        self._writer.writeheader()
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowWriter:
+    """Writes Parquet (zstd) or Arrow IPC files; requires ``pyarrow``."""
+
+    def __init__(self, path: Path, source: Table, fmt: str) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.ipc as ipc
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit(f"--format {fmt} requires pyarrow: {e}")
+        types = [
+            (Integer, pa.int64()),
+            (String, pa.string()),
+            (DateTime, pa.timestamp("us")),
+        ]
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                (col.name, next(t for sa, t in types if isinstance(col.type, sa)))
+                for col in source.columns
+            ]
+        )
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        else:
+            self._writer = ipc.new_file(
+                str(path),
+                self._schema,
+                options=ipc.IpcWriteOptions(compression="zstd"),
+            )
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        batch = self._pa.RecordBatch.from_pylist(rows, schema=self._schema)
+        self._writer.write_batch(batch)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_writer(path: Path, source: Table, fmt: str) -> ChunkWriter:
+    if fmt == "csv":
+        return CsvWriter(path, [col.name for col in source.columns])
+    return ArrowWriter(path, source, fmt)
+
+
+def load_watermark(state_file: Path | None, table_name: str) -> int:
+    if state_file is None or not state_file.exists():
+        return 0
+    return json.loads(state_file.read_text()).get(table_name, 0)
+
+
+def save_watermark(state_file: Path, table_name: str, last_id: int) -> None:
+    state = json.loads(state_file.read_text()) if state_file.exists() else {}
+    state[table_name] = last_id
+    state_file.write_text(json.dumps(state, indent=2))
+
+
+async def export_table(
+    table_name: str,
+    writer: ChunkWriter,
+    after_id: int,
+    since: datetime | None,
+    chunk_size: int,
+    pause: float,
+) -> tuple[int, int]:
+    """Export rows with ``id > after_id`` in id order; returns (rows, last id).
+
+    Each chunk is a separate keyset query in its own read-only transaction,
+    which ends before the chunk is written and before ``pause``.
+    """
+    source = TABLES[table_name]
+    query = select(source).order_by(source.c.id).limit(chunk_size)
+    if since is not None:
+        query = query.where(source.c.created_at >= since)
+
+    engine = create_async_engine(EXPORT_DATABASE_URL)
+    exported, last_id = 0, after_id
+    try:
+        while True:
+            async with engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    await conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                result = await conn.execute(query.where(source.c.id > last_id))
+                rows = [dict(row) for row in result.mappings()]
+            if not rows:
+                break
+            writer.write(rows)
+            exported += len(rows)
+            last_id = rows[-1]["id"]
+            print(f"{table_name}: {exported} rows exported (last id {last_id})")
+            if len(rows) < chunk_size:
+                break
+            if pause:
+                # Throttle to leave headroom for the reservation path.
+                await asyncio.sleep(pause)
+    finally:
+        await engine.dispose()
+    return exported, last_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("output", type=Path)
+    parser.add_argument(
+        "--format", choices=["parquet", "arrow", "csv"], default="parquet"
+    )
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument(
+        "--pause", type=float, default=0.0, help="seconds to sleep between chunks"
+    )
+    parser.add_argument("--after-id", type=int, help="export rows with a larger id")
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, help="export rows created since"
+    )
+    parser.add_argument("--state-file", type=Path, help="watermark file (JSON)")
+    args = parser.parse_args()
+
+    after_id = args.after_id
+    if after_id is None:
+        after_id = load_watermark(args.state_file, args.table)
+
+    started = time.perf_counter()
+    writer = open_writer(args.output, TABLES[args.table], args.format)
+    try:
+        exported, last_id = asyncio.run(
+            export_table(
+                args.table,
+                writer,
+                after_id,
+                args.since,
+                args.chunk_size,
+                args.pause,
+            )
+        )
+    finally:
+        writer.close()
+
+    if args.state_file is not None:
+        save_watermark(args.state_file, args.table, last_id)
+    print(
+        f"Exported {exported} rows from '{args.table}' to {args.output} "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+import math
+from typing import Iterator
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter: no false negatives, ``error_rate`` false positives."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._bits)
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by stacking filters of doubling capacity.
+
+    Each new filter halves its error rate, so the combined false-positive
+    rate stays below ``error_rate`` however often the filter grows.
+    """
+
+    def __init__(self, initial_capacity: int, error_rate: float = 0.01) -> None:
+        self._error_rate = error_rate
+        self._filters = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def add(self, item: str) -> None:
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(
+                current.capacity * 2, self._error_rate / 2 ** (len(self._filters) + 1)
+            )
+            self._filters.append(current)
+        current.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in bloom for bloom in self._filters)
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self._filters)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(bloom.size_bytes for bloom in self._filters)
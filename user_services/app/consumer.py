@@ -2,88 +2,252 @@ import asyncio
 import json
 import logging
 import os
+import time
+import uuid
 from threading import Thread
 from typing import Any
 
 import pika
+from bloom import ScalableBloomFilter
 from database import async_session, create_db_and_tables
-from models import User
+from models import RevokedToken, User
 from passlib.hash import bcrypt
+from pika.exchange_type import ExchangeType
+from profiling import enable_profiling_triggers, timed
+from retries import declare_queue, retry_or_park
 from setup_logger import setup_logging
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from tokens import issue_token
 
 _logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "rabbitmq")
+EMAIL_FILTER_MIN_CAPACITY: int = int(os.getenv("EMAIL_FILTER_MIN_CAPACITY", "100000"))
+EMAIL_FILTER_ERROR_RATE: float = float(os.getenv("EMAIL_FILTER_ERROR_RATE", "0.01"))
+AUTH_EVENTS_EXCHANGE: str = "auth_events"
+TOKEN_REVOKED_QUEUE: str = "user_token_revoked"
+
+# Verified for unknown emails, so a failed login takes as long either way.
+DUMMY_PASSWORD_HASH: str = bcrypt.hash(uuid.uuid4().hex)
+
+email_filter: ScalableBloomFilter | None = None
+email_filter_loaded = asyncio.Event()
+
+
+async def load_email_filter() -> None:
+    """Build the registered-email filter by streaming the user table."""
+    global email_filter
+    started = time.perf_counter()
+    async with async_session() as session:
+        result = await session.execute(select(func.count()).select_from(User))
+        total = result.scalar_one()
+        # Published before streaming, so emails registered meanwhile are kept.
+        email_filter = ScalableBloomFilter(
+            max(total * 2, EMAIL_FILTER_MIN_CAPACITY), EMAIL_FILTER_ERROR_RATE
+        )
+        emails = await session.stream_scalars(
+            select(User.email).execution_options(yield_per=10_000)
+        )
+        async for email in emails:
+            email_filter.add(email)
+    email_filter_loaded.set()
+    _logger.info(
+        f"Email filter loaded with {len(email_filter)} emails "
+        f"({email_filter.size_bytes / 2**20:.1f} MiB) "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+def email_maybe_registered(email: str) -> bool:
+    """Returns False only when ``email`` is definitely not registered yet."""
+    if email_filter is None or not email_filter_loaded.is_set():
+        return True
+    return email in email_filter
+
+
+def remember_email(email: str) -> None:
+    if email_filter is not None:
+        email_filter.add(email)
 
 
 async def register_user(data: dict[str, Any]) -> dict[str, bool | int | str]:
     _logger.info(f"Registering user: {data['username']}")
 
     async with async_session() as session:
-        result = await session.execute(select(User).where(User.email == data["email"]))
-        existing_user = result.scalars().first()
+        if email_maybe_registered(data["email"]):
+            result = await session.execute(
+                select(User).where(User.email == data["email"])
+            )
+            existing_user = result.scalars().first()
 
-        if existing_user:
-            _logger.warning(f"Email already registered: {data['email']}")
-            return {"success": False, "error": "Email already exists"}
+            if existing_user:
+                _logger.warning(f"Email already registered: {data['email']}")
+                return {"success": False, "error": "Email already exists"}
 
         user = User(
             username=data["username"],
             email=data["email"],
-            password_hash=bcrypt.hash(data["password"]),
+            password_hash=await asyncio.to_thread(bcrypt.hash, data["password"]),
         )
         session.add(user)
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent registration of the same email.
+            await session.rollback()
+            remember_email(data["email"])
+            _logger.warning(f"Email already registered: {data['email']}")
+            return {"success": False, "error": "Email already exists"}
         await session.refresh(user)
+        remember_email(user.email)
 
         _logger.info(f"User registered with ID: {user.id}")
         return {"success": True, "user_id": user.id}
 
 
+async def login_user(data: dict[str, Any]) -> dict[str, bool | int | str]:
+    _logger.info(f"Logging in user: {data['email']}")
+
+    async with async_session() as session:
+        result = await session.execute(select(User).where(User.email == data["email"]))
+        user = result.scalars().first()
+
+    # bcrypt is deliberately slow; keep it off the event loop.
+    password_hash = user.password_hash if user is not None else DUMMY_PASSWORD_HASH
+    valid = await asyncio.to_thread(bcrypt.verify, data["password"], password_hash)
+    if user is None or not valid:
+        _logger.warning(f"Invalid credentials for: {data['email']}")
+        return {"success": False, "error": "Invalid email or password"}
+
+    token, expires_at = issue_token(user.id)
+    _logger.info(f"User logged in with ID: {user.id}")
+    return {"success": True, "access_token": token, "expires_at": expires_at}
+
+
+async def store_revoked_token(data: dict[str, Any]) -> None:
+    """Persist a revocation so gateways can load it when they start."""
+    async with async_session() as session:
+        # Revocations of expired tokens are not needed any more.
+        await session.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at <= int(time.time()))
+        )
+        if await session.get(RevokedToken, data["jti"]) is None:
+            session.add(RevokedToken(jti=data["jti"], expires_at=int(data["exp"])))
+        await session.commit()
+    _logger.info(f"Stored revocation of token {data['jti']}")
+
+
+def reply(
+    channel: pika.adapters.blocking_connection.BlockingChannel,
+    props: pika.BasicProperties,
+    response: dict[str, Any],
+) -> None:
+    if props and props.reply_to:
+        channel.basic_publish(
+            exchange="",
+            routing_key=props.reply_to,
+            properties=pika.BasicProperties(correlation_id=props.correlation_id),
+            body=json.dumps(response),
+        )
+
+
+@timed("process_message")
 def process_message(
     body: bytes,
     props: pika.BasicProperties,
     channel: pika.adapters.blocking_connection.BlockingChannel,
     loop: asyncio.AbstractEventLoop,
 ) -> bool:
-    try:
-        data: dict[str, Any] = json.loads(body)
-        _logger.info(f"Processing user registration: {data}")
-
-        future = asyncio.run_coroutine_threadsafe(register_user(data), loop)
-        result = future.result(timeout=30)
-        if props.reply_to:
-            channel.basic_publish(
-                exchange="",
-                routing_key=props.reply_to,
-                properties=pika.BasicProperties(correlation_id=props.correlation_id),
-                body=json.dumps(result),
-            )
+    data: dict[str, Any] = json.loads(body)
+    _logger.info(f"Processing user registration: {data}")
+
+    future = asyncio.run_coroutine_threadsafe(register_user(data), loop)
+    result = future.result(timeout=30)
+    reply(channel, props, result)
+    return True
+
+
+@timed("process_login")
+def process_login(
+    body: bytes,
+    props: pika.BasicProperties,
+    channel: pika.adapters.blocking_connection.BlockingChannel,
+    loop: asyncio.AbstractEventLoop,
+) -> bool:
+    data: dict[str, Any] = json.loads(body)
+
+    future = asyncio.run_coroutine_threadsafe(login_user(data), loop)
+    result = future.result(timeout=30)
+    reply(channel, props, result)
+    return True
+
+
+@timed("process_token_revoked")
+def process_token_revoked(
+    body: bytes,
+    loop: asyncio.AbstractEventLoop,
+) -> bool:
+    data: dict[str, Any] = json.loads(body)
+    if data.get("type") != "token_revoked":
         return True
-    except Exception as e:
-        _logger.error(f"Error processing user registration: {e}")
-        return False
+
+    future = asyncio.run_coroutine_threadsafe(store_revoked_token(data), loop)
+    future.result(timeout=30)
+    return True
 
 
 def consume_messages(loop: asyncio.AbstractEventLoop) -> None:
     connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
     channel = connection.channel()
 
-    queue_name = "user_register"
-    channel.queue_declare(queue=queue_name, durable=True)
+    declare_queue(channel, "user_register")
+    declare_queue(channel, "user_login")
+    # Durable copy of the gateways' revocation broadcasts.
+    channel.exchange_declare(
+        exchange=AUTH_EVENTS_EXCHANGE, exchange_type=ExchangeType.fanout, durable=True
+    )
+    declare_queue(channel, TOKEN_REVOKED_QUEUE)
+    channel.queue_bind(queue=TOKEN_REVOKED_QUEUE, exchange=AUTH_EVENTS_EXCHANGE)
     channel.basic_qos(prefetch_count=1)
 
-    def on_message(ch, method, props, body) -> None:
-        success = process_message(body, props, ch, loop)
-        if method and method.delivery_tag is not None:
-            if success:
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            else:
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    def on_register(ch, method, props, body) -> None:
+        try:
+            process_message(body, props, ch, loop)
+        except Exception as e:
+            # The body carries a plaintext password, so it is never republished
+            # to a retry or parking queue; the client has to try again.
+            _logger.error(f"Error processing user registration: {e}")
+            reply(ch, props, {"success": False, "error": "Registration failed"})
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def on_login(ch, method, props, body) -> None:
+        try:
+            process_login(body, props, ch, loop)
+        except Exception as e:
+            # Like registrations, logins carry a password and are never parked.
+            _logger.error(f"Error processing user login: {e}")
+            reply(ch, props, {"success": False, "error": "Login failed"})
+        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    channel.basic_consume(queue=queue_name, on_message_callback=on_message)
-    _logger.info("Started consuming on 'user_register'")
+    def on_token_revoked(ch, method, props, body) -> None:
+        try:
+            process_token_revoked(body, loop)
+        except Exception as e:
+            _logger.error(f"Error storing token revocation: {e}")
+            retry_or_park(ch, TOKEN_REVOKED_QUEUE, method, props, body, e)
+        else:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    channel.basic_consume(queue="user_register", on_message_callback=on_register)
+    channel.basic_consume(queue="user_login", on_message_callback=on_login)
+    channel.basic_consume(
+        queue=TOKEN_REVOKED_QUEUE, on_message_callback=on_token_revoked
+    )
+    _logger.info(
+        f"Started consuming on 'user_register', 'user_login' "
+        f"and '{TOKEN_REVOKED_QUEUE}'"
+    )
     channel.start_consuming()
 
 
@@ -91,7 +255,13 @@ async def main() -> None:
     setup_logging()
     await create_db_and_tables()
     loop = asyncio.get_running_loop()
+    enable_profiling_triggers(loop)
     Thread(target=consume_messages, args=(loop,), daemon=True).start()
+    # Registrations fall back to the email lookup until the filter is loaded.
+    try:
+        await load_email_filter()
+    except Exception as e:
+        _logger.error(f"Failed to load email filter, using lookups only: {e}")
     while True:
         await asyncio.sleep(1)
 
@@ -9,3 +9,12 @@ class User(SQLModel, table=True):
     email: str = Field(index=True, unique=True)
     password_hash: str
     created_at: datetime = Field(default_factory=datetime.now)
+
+
+class RevokedToken(SQLModel, table=True):
+    """Revoked access token, kept until it would have expired anyway."""
+
+    __tablename__ = "revoked_token"
+
+    jti: str = Field(primary_key=True)
+    expires_at: int = Field(index=True)
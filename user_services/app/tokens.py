@@ -0,0 +1,37 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+AUTH_SECRET_KEY: str = os.getenv("AUTH_SECRET_KEY", "")
+AUTH_TOKEN_TTL: int = int(os.getenv("AUTH_TOKEN_TTL", "900"))
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def issue_token(user_id: int) -> tuple[str, int]:
+    """Returns a signed ``<payload>.<signature>`` token and its expiry timestamp.
+
+    The gateway verifies the HMAC-SHA256 signature with the shared
+    ``AUTH_SECRET_KEY``, without calling back into this service.
+    """
+    if not AUTH_SECRET_KEY:
+        raise RuntimeError("AUTH_SECRET_KEY is not set")
+    issued_at = int(time.time())
+    expires_at = issued_at + AUTH_TOKEN_TTL
+    claims = {
+        "sub": user_id,
+        "jti": uuid.uuid4().hex,
+        "iat": issued_at,
+        "exp": expires_at,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signature = hmac.new(
+        AUTH_SECRET_KEY.encode(), payload.encode(), hashlib.sha256
+    ).digest()
+    return f"{payload}.{_b64encode(signature)}", expires_at